@@ -1,41 +1,37 @@
 import os
+import re
+import uuid
 import base64
-import aiofiles
-import aiosqlite
+import asyncio
+import atexit
+import queue
 from dotenv import load_dotenv
 from typing_extensions import TypedDict, Literal, Annotated, Optional, List
-from langchain.chat_models import init_chat_model
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, AnyMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, AnyMessage, ToolMessage, message_chunk_to_message
 from langchain_core.prompts import SystemMessagePromptTemplate, HumanMessagePromptTemplate
 from langchain_core.tools import tool
-from langgraph.graph import MessagesState, StateGraph, START, END
+from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import tools_condition, ToolNode
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
-from agent_tools_utils import (
-    filter_by_date_and_sum,
-    filter_by_date_and_count,
-    filter_by_type_and_sum,
-    filter_by_type_and_count,
-    filter_by_amount_and_sum,
-    filter_by_amount_and_count
-)
-from agent_models_utils import TransactionTrim
+from langgraph.checkpoint.memory import MemorySaver
+from agent_tools_utils import query_transactions
 import logging
-import openai
+from logging.handlers import QueueHandler, QueueListener
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure logging
+# Configure logging. Records are formatted by the QueueHandler and written by
+# the listener's thread, so the event loop never blocks on console or file I/O.
+log_queue: queue.Queue = queue.Queue(-1)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('app.log')
-    ]
+    handlers=[QueueHandler(log_queue)]
 )
+log_listener = QueueListener(log_queue, logging.StreamHandler(), logging.FileHandler('app.log'))
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
 # Verify OPENAI_API_KEY is set
@@ -43,23 +39,15 @@ if not os.environ.get("OPENAI_API_KEY"):
     logger.error("OPENAI_API_KEY environment variable is not set")
     raise ValueError("OPENAI_API_KEY environment variable is not set")
 
-# Verify aiosqlite availability
-try:
-    import aiosqlite
-    logger.info("aiosqlite module is imported successfully")
-except ImportError as e:
-    logger.error(f"Failed to import aiosqlite module: {str(e)}")
-    raise
-
 # State schemas
 class InputStateSchema(TypedDict):
     messages: Annotated[list[AnyMessage], add_messages]
-    transactions: List[TransactionTrim]
+    transactions: List[dict]
     get_audio: Optional[bool]
 
 class SharedStateSchema(TypedDict):
     messages: Annotated[list[AnyMessage], add_messages]
-    transactions: List[TransactionTrim]
+    transactions: List[dict]
     status: str
     get_audio: Optional[bool]
     audio: Optional[str]
@@ -69,32 +57,38 @@ class OutputStateSchema(TypedDict):
     status: Optional[str]
     audio: Optional[str]
 
-# Initialize model
-llm = init_chat_model(
-    model="gpt-4o-mini",
-    model_provider="openai",
-    temperature=0
-)
+# Tool definition
+tool_list = [query_transactions]
 
-# Initialize OpenAI async client for TTS
-openai_client = openai.AsyncClient(api_key=os.environ["OPENAI_API_KEY"])
+# Model and TTS client are built on first use; importing langchain's chat
+# models and openai dominates cold start, so it's kept off the import path
+llm_with_tools = None
+openai_client = None
 
-# Tool definition
-tool_list = [
-    filter_by_date_and_sum,
-    filter_by_date_and_count,
-    filter_by_type_and_sum,
-    filter_by_type_and_count,
-    filter_by_amount_and_sum,
-    filter_by_amount_and_count
-]
-llm_with_tools = llm.bind_tools(tools=tool_list)
+def get_llm_with_tools():
+    global llm_with_tools
+    if llm_with_tools is None:
+        from langchain.chat_models import init_chat_model
+        llm = init_chat_model(
+            model="gpt-4o-mini",
+            model_provider="openai",
+            temperature=0
+        )
+        llm_with_tools = llm.bind_tools(tools=tool_list)
+    return llm_with_tools
+
+def get_openai_client():
+    global openai_client
+    if openai_client is None:
+        import openai
+        openai_client = openai.AsyncClient(api_key=os.environ["OPENAI_API_KEY"])
+    return openai_client
 
 # System prompt
 ASSISTANT_SYSTEM_TEMPLATE = """
 You are AI Query, a knowledgeable and professional financial assistant. Your role is to provide accurate, concise, and helpful responses about financial transactions without disclosing specific transaction data. Use the provided tools to analyze the `transactions` list and generate insights.
 
-**Transactions**: A list of transaction objects with fields: transactionId, amount, type ('credit' or 'debit'), currency (NGN), balance, and transactionDate (ISO 8601).
+**Transactions**: A list of transaction objects with fields: transactionId, amount, type ('credit' or 'debit'), currency (NGN), balance, and transactionDate (ISO 8601). The rows are only visible to the tools; each prompt's `*transactions*` gives a summary with the count, date range and current balance.
 - **transactionId**: Unique identifier for the transaction.
 - **amount**: Monetary value of the transaction, used for calculating totals and analyzing spending or income.
 - **type**: Indicates 'credit' (income) or 'debit' (expenditure), critical for financial trend analysis.
@@ -111,32 +105,11 @@ You are AI Query, a knowledgeable and professional financial assistant. Your rol
 - Ensure all monetary amounts are reported in NGN with two decimal places (e.g., 1234.56 NGN).
 
 **Tool Selection Guidelines**:
-To select the appropriate tool, follow this step-by-step decision tree based on the query's intent and keywords. The available tools are designed to filter and aggregate transactions based on date, type, or amount.
-
-### Decision Tree for Tool Selection
-1. **Identify the Query Intent**:
-   - **Listing or Filtering Transactions**: If the query asks to "show," "list," "find," or "get" transactions with specific conditions (e.g., date range, amount, or type), use `filter_by_date_and_sum`, `filter_by_type_and_sum`, or `filter_by_amount_and_sum` with appropriate parameters.
-   - **Summarizing Amounts**: If the query asks for the "total," "sum," "amount spent," "amount earned," or similar aggregations, use a sum-based tool (`filter_by_date_and_sum`, `filter_by_type_and_sum`, or `filter_by_amount_and_sum`) based on the filter condition.
-   - **Counting Transactions**: If the query asks "how many" or "count" transactions (with or without conditions), use a count-based tool (`filter_by_date_and_count`, `filter_by_type_and_count`, or `filter_by_amount_and_count`) based on the filter condition.
+All transaction analysis goes through a single tool, `query_transactions`. It filters transactions by any combination of date range, type, and amount range, then aggregates them according to `op`.
 
-### Examples of Query-to-Tool Mapping
-- **Date-Based Queries**:
-  - "Show transactions in August 2025" → `filter_by_date_and_sum(start_date="2025-08-01"`, `end_date="2025-08-31"`)
-  - "Total debit amount in August 2025" → `filter_by_date_and_sum(start_date="2025-08-01"`, `end_date="2025-08-31"`, `transaction_type="debit"`)
-  - "How many credit transactions in January 2025?" → `filter_by_date_and_count(start_date="2025-01-01"`, `end_date="2025-01-31"`, `transaction_type="credit"`)
-- **Amount-Based Queries**:
-  - "Show transactions above 1000 NGN" → `filter_by_amount_and_sum(min_amount=1000)`
-  - "Total amount for transactions between 500 and 2000 NGN" → `filter_by_amount_and_sum(min_amount=500, max_amount=2000)`
-  - "Count transactions below 500 NGN" → `filter_by_amount_and_count(max_amount=500)`
-- **Type-Based Queries**:
-  - "Total credit amount" → `filter_by_type_and_sum(transaction_type="credit")`
-  - "How many debit transactions?" → `filter_by_type_and_count(transaction_type="debit")`
-- **Complex Queries**:
-  - "Show debit transactions above 1000 NGN in August 2025" → `filter_by_date_and_sum(start_date="2025-08-01"`, `end_date="2025-08-31"`, `transaction_type="debit"`, `min_amount=1000`)
-  - "Total credit amount from January to March 2025" → `filter_by_date_and_sum(start_date="2025-01-01"`, `end_date="2025-03-31"`, `transaction_type="credit"`)
-- **General Queries**:
-  - "What is my total spending?" → `filter_by_type_and_sum(transaction_type="debit")`
-  - "How many transactions do I have?" → `filter_by_type_and_count()`
+### Choosing `op`
+- **Summarizing Amounts**: If the query asks for the "total," "sum," "amount spent," "amount earned," or asks to "show," "list," "find," or "get" transactions, use `op="sum"`.
+- **Counting Transactions**: If the query asks "how many" or "count" transactions (with or without conditions), use `op="count"`.
 
 ### Date Parsing Guidelines
 - Parse human-readable date references into `YYYY-MM-DD` format based on the current date (provided as `*date*` in the prompt).
@@ -154,23 +127,107 @@ To select the appropriate tool, follow this step-by-step decision tree based on
   - "Debit," "expense," "spent" → `transaction_type="debit"`
 
 ### Notes for Complex Queries
-- **Multiple Conditions**: For queries with multiple conditions (e.g., date and amount), combine parameters in the appropriate tool (e.g., `filter_by_date_and_sum` with `start_date`, `end_date`, and `transaction_type`).
+- **Multiple Conditions**: For queries with multiple conditions (e.g., date and amount), pass all the matching parameters in one `query_transactions` call (e.g., `start_date`, `end_date`, and `transaction_type`).
 - **Date Calculations**: For relative dates like "last month" or "this year," calculate the appropriate `start_date` and `end_date` based on the current date (provided in the prompt as `*date*`).
 - **Error Handling**: If a query specifies an invalid date (e.g., "February 30") or future date beyond today, respond with: "Invalid date range specified. Please provide a valid date range."
-- **No Filters**: If a specialized tool is called without parameters (e.g., `filter_by_date_and_sum` with no `start_date`), it processes all transactions.
+- **No Filters**: If `query_transactions` is called with only `op`, it processes all transactions.
+"""
+
+# Appended to the system prompt only after a tool call in the current turn has failed
+TOOL_EXAMPLES_TEMPLATE = """
+### Examples of Query-to-Tool Mapping
+- "Total debit amount in August 2025" → `query_transactions(op="sum", start_date="2025-08-01", end_date="2025-08-31", transaction_type="debit")`
+- "How many credit transactions in January 2025?" → `query_transactions(op="count", start_date="2025-01-01", end_date="2025-01-31", transaction_type="credit")`
+- "Total amount for transactions between 500 and 2000 NGN" → `query_transactions(op="sum", min_amount=500, max_amount=2000)`
+- "How many transactions do I have?" → `query_transactions(op="count")`
 
-By following this decision tree and examples, you can accurately map any transaction-related query to the appropriate tool(s) and parameters.
 """
 
 sys_msg_tmplt = SystemMessagePromptTemplate.from_template(ASSISTANT_SYSTEM_TEMPLATE)
+sys_msg_with_examples_tmplt = SystemMessagePromptTemplate.from_template(ASSISTANT_SYSTEM_TEMPLATE + TOOL_EXAMPLES_TEMPLATE)
+
+# The templates have no per-request variables, so format them once
+system_message = sys_msg_tmplt.format(name="Eva")
+system_message_with_examples = sys_msg_with_examples_tmplt.format(name="Eva")
+
+def has_tool_error(messages: list[AnyMessage]) -> bool:
+    # Only look back as far as the latest human message, i.e. the current turn
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            return False
+        if isinstance(msg, ToolMessage) and msg.status == "error":
+            return True
+    return False
+
+# Sentence boundary for incremental TTS; requires whitespace so "1234.56" isn't split
+SENTENCE_END = re.compile(r"(?<=[.?!])\s+")
+
+# TTS tasks started while streaming, keyed by the id of the AIMessage they voice
+pending_audio: dict[str, list[asyncio.Task]] = {}
+
+async def text_to_speech(text: str) -> bytes:
+    response = await get_openai_client().audio.speech.create(
+        model="tts-1",
+        voice="alloy",
+        input=text
+    )
+    return response.content
+
+async def cancel_tasks(tasks: list[asyncio.Task]):
+    # Cancel and reap, so failed clips don't log "Task exception was never retrieved"
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def stream_with_speech(messages: list[AnyMessage]) -> AIMessage:
+    """
+    Stream the LLM response and start TTS for each sentence as soon as it is complete,
+    so audio generation overlaps with token generation.
+    """
+    response = None
+    buffer = ""
+    tasks: list[asyncio.Task] = []
+    try:
+        async for chunk in get_llm_with_tools().astream(messages):
+            response = chunk if response is None else response + chunk
+            if response.tool_call_chunks:
+                # Not the final answer, so stop paying for speech of its preamble
+                if tasks:
+                    await cancel_tasks(tasks)
+                    tasks = []
+                continue
+            if isinstance(chunk.content, str) and chunk.content:
+                buffer += chunk.content
+                *sentences, buffer = SENTENCE_END.split(buffer)
+                tasks.extend(asyncio.create_task(text_to_speech(s)) for s in sentences if s.strip())
+    except BaseException:
+        await cancel_tasks(tasks)
+        raise
+    response = message_chunk_to_message(response)
+    if response.tool_calls:
+        # The speaker only voices the message that ends the turn
+        await cancel_tasks(tasks)
+        return response
+    if buffer.strip():
+        tasks.append(asyncio.create_task(text_to_speech(buffer)))
+    if response.id is None:
+        response.id = str(uuid.uuid4())
+    if tasks:
+        pending_audio[response.id] = tasks
+    return response
 
 # Assistant node
 async def assistant(state: InputStateSchema) -> SharedStateSchema:
-    system_message = sys_msg_tmplt.format(name="Eva")
     messages_list = state['messages']
+    sys_msg = system_message_with_examples if has_tool_error(messages_list) else system_message
     try:
-        llm_response = await llm_with_tools.ainvoke([system_message] + messages_list)
-        logger.info(f"Processed messages: {messages_list}, Tool calls: {llm_response.tool_calls if hasattr(llm_response, 'tool_calls') else 'None'}")
+        if state.get('get_audio', False):
+            llm_response = await stream_with_speech([sys_msg] + messages_list)
+        else:
+            llm_response = await get_llm_with_tools().ainvoke([sys_msg] + messages_list)
+        # Formatting the whole history is costly, so only do it when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Processed messages: {messages_list}, Tool calls: {llm_response.tool_calls if hasattr(llm_response, 'tool_calls') else 'None'}")
         return {
             "messages": llm_response,
             "status": "Assistant done",
@@ -185,7 +242,9 @@ async def assistant(state: InputStateSchema) -> SharedStateSchema:
 # Speaker node for text to speech
 async def speaker(state: SharedStateSchema) -> SharedStateSchema:
     try:
-        last_message = next((msg for msg in reversed(state['messages']) if isinstance(msg, AIMessage)), None)
+        # speaker only runs straight after assistant, so its AIMessage is the newest one
+        messages = state['messages']
+        last_message = messages[-1] if messages and isinstance(messages[-1], AIMessage) else None
         if not last_message or not last_message.content:
             logger.warning("No valid assistant message found for TTS conversion")
             return {
@@ -196,21 +255,19 @@ async def speaker(state: SharedStateSchema) -> SharedStateSchema:
                 "get_audio": state.get('get_audio', False)
             }
 
-        text_to_convert = last_message.content
-        response = await openai_client.audio.speech.create(
-            model="tts-1",
-            voice="alloy",
-            input=text_to_convert
-        )
-
-        async with aiofiles.tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-            await temp_file.write(response.content)
-            temp_file_path = temp_file.name
-
-        async with aiofiles.open(temp_file_path, "rb") as audio_file:
-            audio_base64 = base64.b64encode(await audio_file.read()).decode("utf-8")
+        tasks = pending_audio.pop(last_message.id, None)
+        if tasks:
+            # MP3 frames are self-contained, so per-sentence clips can be concatenated
+            try:
+                audio_content = b"".join(await asyncio.gather(*tasks))
+            except BaseException:
+                # gather doesn't stop the other clips when one fails
+                await cancel_tasks(tasks)
+                raise
+        else:
+            audio_content = await text_to_speech(last_message.content)
 
-        os.unlink(temp_file_path)
+        audio_base64 = base64.b64encode(audio_content).decode("ascii")
         logger.info("Successfully generated and encoded audio")
         return {
             "audio": audio_base64,
@@ -235,26 +292,23 @@ def generate_audio(state: SharedStateSchema) -> Literal["speaker", "__end__"]:
         return "speaker"
     return "__end__"
 
-# Function to create the graph with a new database connection
+# Function to create the graph with an in-process checkpointer
 async def create_graph():
     try:
-        conn = await aiosqlite.connect(":memory:")
-        await conn.execute("SELECT 1")
-        await conn.commit()
-        logger.info("Successfully tested aiosqlite connection")
-        memory = AsyncSqliteSaver(conn)
-        logger.info("Initialized AsyncSqliteSaver with in-memory SQLite database")
+        # Checkpoints never leave the process, so a dict-backed saver avoids SQLite overhead
+        memory = MemorySaver()
+        logger.info("Initialized in-memory checkpointer")
         graph_builder = StateGraph(SharedStateSchema, input_schema=InputStateSchema, output_schema=OutputStateSchema)
         graph_builder.add_node("assistant", assistant)
         graph_builder.add_node("speaker", speaker)
-        graph_builder.add_node("tools", ToolNode(tool_list))
+        graph_builder.add_node("tools", ToolNode(tool_list, handle_tool_errors=True))
         graph_builder.add_edge(START, "assistant")
         graph_builder.add_conditional_edges("assistant", tools_condition)
         graph_builder.add_edge("tools", "assistant")
         graph_builder.add_conditional_edges("assistant", generate_audio)
         graph_builder.add_edge("assistant", END)
         graph = graph_builder.compile(checkpointer=memory)
-        logger.info("Compiled LangGraph with AsyncSqliteSaver using aiosqlite")
+        logger.info("Compiled LangGraph with MemorySaver")
         return graph
     except Exception as e:
         logger.error(f"Failed to compile graph: {str(e)}", exc_info=True)
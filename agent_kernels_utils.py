@@ -0,0 +1,49 @@
+import numpy as np
+from numba import njit
+
+# Transaction type codes stored in TransactionArrays.types
+TYPE_DEBIT = 0
+TYPE_CREDIT = 1
+TYPE_ANY = -1
+
+# Sentinels meaning "no bound" for the kernel filter arguments
+NO_MIN_AMOUNT = -np.inf
+NO_MAX_AMOUNT = np.inf
+NO_START_TS = np.iinfo(np.int64).min
+NO_END_TS = np.iinfo(np.int64).max
+
+# ToolNode gathers parallel tool calls and runs sync tools in executor threads;
+# the kernels release the GIL so those threads actually overlap.
+@njit(cache=True, nogil=True)
+def sum_filtered(amounts, timestamps, types, min_amount, max_amount, start_ts, end_ts, type_code):
+    # Filter and reduce in a single pass, without materializing a mask
+    total = 0.0
+    for i in range(amounts.shape[0]):
+        a = amounts[i]
+        ts = timestamps[i]
+        if a >= min_amount and a <= max_amount and ts >= start_ts and ts <= end_ts \
+                and (type_code == TYPE_ANY or types[i] == type_code):
+            total += a
+    return total
+
+@njit(cache=True, nogil=True)
+def count_filtered(amounts, timestamps, types, min_amount, max_amount, start_ts, end_ts, type_code):
+    count = 0
+    for i in range(amounts.shape[0]):
+        a = amounts[i]
+        ts = timestamps[i]
+        if a >= min_amount and a <= max_amount and ts >= start_ts and ts <= end_ts \
+                and (type_code == TYPE_ANY or types[i] == type_code):
+            count += 1
+    return count
+
+def warm_up():
+    # Trigger JIT compilation (or load it from the on-disk cache) ahead of the first request
+    amounts = np.zeros(1, dtype=np.float64)
+    timestamps = np.zeros(1, dtype=np.int64)
+    # Read-only like the array _to_soa builds with np.frombuffer; Numba compiles
+    # a separate specialization for writable arrays
+    types = np.frombuffer(b"\x00", dtype=np.uint8)
+    args = (amounts, timestamps, types, NO_MIN_AMOUNT, NO_MAX_AMOUNT, NO_START_TS, NO_END_TS, TYPE_ANY)
+    sum_filtered(*args)
+    count_filtered(*args)
@@ -1,81 +1,64 @@
-from typing_extensions import TypedDict, Optional, List, Union, Literal
-from datetime import datetime
+import msgspec
+from typing_extensions import Optional, List, Union, Literal, Annotated
+from datetime import datetime, timezone
 from enum import Enum
 
 class TransactionType(str, Enum):
     CREDIT = "credit"
     DEBIT = "debit"
 
-class TransactionTrim(TypedDict):
+# ISO 8601 UTC timestamp, e.g. 2024-08-26T21:29:39.211000Z
+IsoDate = Annotated[str, msgspec.Meta(pattern=r"^\d{4}-\d{2}-\d{2}T.*Z$")]
+
+# Validated by msgspec while the request JSON is decoded
+class TransactionTrim(msgspec.Struct):
     transactionId: str
     amount: Union[str, int, float]
     type: Literal["credit", "debit"]
-    currency: str
+    currency: Literal["NGN"]
     balance: Union[str, int, float]
-    transactionDate: str  # ISO 8601 format
-
-    def __init__(self, **kwargs):
-        # Manual validation
-        if not isinstance(kwargs.get('transactionId'), str):
-            raise ValueError("transactionId must be a string")
-        if not isinstance(kwargs.get('amount'), (str, int, float)):
-            raise ValueError("amount must be a number or string")
-        if kwargs.get('type') not in ['credit', 'debit']:
-            raise ValueError("type must be 'credit' or 'debit'")
-        if kwargs.get('currency') != 'NGN':
-            raise ValueError("currency must be 'NGN'")
-        if not isinstance(kwargs.get('balance'), (str, int, float)):
-            raise ValueError("balance must be a number or string")
-        if not isinstance(kwargs.get('transactionDate'), str):
-            raise ValueError("transactionDate must be in ISO 8601 format")
+    transactionDate: IsoDate
 
-class Transaction(TypedDict, total=False):
+class Transaction(msgspec.Struct):
     transactionId: str
-    narration: Optional[str]
     amount: Union[str, int, float]
     type: Literal["credit", "debit"]
-    category: Optional[str]
-    currency: str
+    currency: Literal["NGN"]
     balance: Union[str, int, float]
-    transactionDate: str  # ISO 8601 format
-    description: Optional[str]
-    icon: Optional[str]  # URL as string
-    id: Optional[int]
-    unAllocatedAmount: Optional[int]
-    bankName: Optional[str]
-    accountId: Optional[str]
-    createdAt: Optional[str]  # ISO 8601 format
-    updatedAt: Optional[str]  # ISO 8601 format
-    deletedAt: Optional[str]  # ISO 8601 format
-
-    def __init__(self, **kwargs):
-        # Manual validation for required fields
-        if not isinstance(kwargs.get('transactionId'), str):
-            raise ValueError("transactionId must be a string")
-        if not isinstance(kwargs.get('amount'), (str, int, float)):
-            raise ValueError("amount must be a number or string")
-        if kwargs.get('type') not in ['credit', 'debit']:
-            raise ValueError("type must be 'credit' or 'debit'")
-        if kwargs.get('currency') != 'NGN':
-            raise ValueError("currency must be 'NGN'")
-        if not isinstance(kwargs.get('balance'), (str, int, float)):
-            raise ValueError("balance must be a number or string")
-        if not isinstance(kwargs.get('transactionDate'), str):
-            raise ValueError("transactionDate must be in ISO 8601 format")
+    transactionDate: IsoDate
+    narration: Optional[str] = None
+    category: Optional[str] = None
+    description: Optional[str] = None
+    icon: Optional[str] = None  # URL as string
+    id: Optional[int] = None
+    unAllocatedAmount: Optional[int] = None
+    bankName: Optional[str] = None
+    accountId: Optional[str] = None
+    createdAt: Optional[str] = None  # ISO 8601 format
+    updatedAt: Optional[str] = None  # ISO 8601 format
+    deletedAt: Optional[str] = None  # ISO 8601 format
 
 def convert_to_float(value: Union[str, int, float]) -> float:
     if isinstance(value, str):
         return float(value.replace(',', ''))
     return float(value)
 
+def iso_to_timestamp(value: str) -> int:
+    # Epoch seconds for an ISO 8601 UTC timestamp such as 2024-08-26T21:29:39.211000Z
+    return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+
+def date_to_timestamp(value: str) -> int:
+    # Epoch seconds for midnight UTC of a YYYY-MM-DD date
+    return int(datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp())
+
 def transaction_trim_to_dict(t: TransactionTrim) -> dict:
-    d = t.copy()
+    d = msgspec.structs.asdict(t)
     d['amount'] = convert_to_float(d['amount'])
     d['balance'] = convert_to_float(d['balance'])
     return d
 
 def transaction_to_dict(t: Transaction) -> dict:
-    d = t.copy()
+    d = msgspec.structs.asdict(t)
     d['amount'] = convert_to_float(d['amount'])
     d['balance'] = convert_to_float(d['balance'])
     return d
\ No newline at end of file
@@ -1,9 +1,25 @@
 import json
-from datetime import datetime, timezone
+import functools
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+import numpy as np
+from cachetools import LRUCache
 from langchain_core.tools import tool
-from typing_extensions import TypedDict, Optional, List, Union, Literal
-from agent_models_utils import TransactionTrim, TransactionType
-import re
+from langgraph.prebuilt import InjectedState
+from typing_extensions import TypedDict, Optional, List, Union, Literal, Annotated
+from agent_models_utils import TransactionType, date_to_timestamp
+from agent_kernels_utils import (
+    sum_filtered,
+    count_filtered,
+    TYPE_DEBIT,
+    TYPE_CREDIT,
+    TYPE_ANY,
+    NO_MIN_AMOUNT,
+    NO_MAX_AMOUNT,
+    NO_START_TS,
+    NO_END_TS
+)
 
 class ToolResult(TypedDict):
     success: bool
@@ -21,144 +37,135 @@ class TransactionAmountFilterInput(TypedDict, total=False):
 class TransactionTypeFilterInput(TypedDict, total=False):
     transaction_type: Optional[TransactionType]
 
-@tool
-def filter_by_date_and_sum(transactions: List[TransactionTrim], start_date: Optional[str] = None, end_date: Optional[str] = None) -> float:
-    """
-    Filter transactions by date range and sum their amounts.
-
-    Args:
-        transactions: List of TransactionTrim dictionaries.
-        start_date: Optional start date in YYYY-MM-DD format.
-        end_date: Optional end date in YYYY-MM-DD format. Defaults to start_date if not provided.
-
-    Returns:
-        float: Sum of amounts for filtered transactions.
-    """
-    date_pattern = r"^\d{4}-\d{2}-\d{2}$"
-    if start_date and not re.match(date_pattern, start_date):
-        raise ValueError("start_date must be in YYYY-MM-DD format")
-    if end_date and not re.match(date_pattern, end_date):
-        raise ValueError("end_date must be in YYYY-MM-DD format")
-
-    filtered = transactions
-    if start_date:
-        start = datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
-        end = datetime.strptime(end_date, '%Y-%m-%d').replace(tzinfo=timezone.utc) if end_date else start
-        filtered = [
-            t for t in transactions
-            if start <= datetime.fromisoformat(t['transactionDate'].replace('Z', '+00:00')).astimezone(timezone.utc) <= end
-        ]
-    return sum(float(t['amount']) for t in filtered)
+# Transactions are injected from graph state rather than generated by the LLM,
+# so every tool call in a turn receives the same list object.
+InjectedTransactions = Annotated[List[dict], InjectedState("transactions")]
+
+@dataclass
+class TransactionArrays:
+    """Struct-of-arrays view of a transactions list."""
+    amounts: np.ndarray  # float64
+    timestamps: np.ndarray  # int64 epoch seconds, UTC
+    types: np.ndarray  # uint8, TYPE_DEBIT or TYPE_CREDIT
+
+# Keyed on id(transactions). The list is held alongside its arrays so the id
+# can't be recycled while the entry is alive (lists can't be weakly referenced).
+_SOA_CACHE: "OrderedDict[int, tuple[list, TransactionArrays]]" = OrderedDict()
+_SOA_CACHE_SIZE = 32
+
+# Tool results keyed on (tool name, args, id(transactions)). Tools are pure and
+# the transactions list doesn't change within a turn. As in _SOA_CACHE, each
+# value holds its list so the id can't be recycled while the entry is alive.
+_RESULT_CACHE: LRUCache = LRUCache(maxsize=128)
+
+# ToolNode runs sync tools in executor threads, possibly several at once
+_CACHE_LOCK = threading.Lock()
+
+def _to_soa(transactions: List[dict]) -> TransactionArrays:
+    with _CACHE_LOCK:
+        cached = _SOA_CACHE.get(id(transactions))
+        if cached is not None and cached[0] is transactions:
+            _SOA_CACHE.move_to_end(id(transactions))
+            return cached[1]
+
+    n = len(transactions)
+    # 'amount' and '_ts' are normalized once at request ingress (see main.prepare_transactions)
+    amounts = np.fromiter([t['amount'] for t in transactions], dtype=np.float64, count=n)
+    timestamps = np.fromiter([t['_ts'] for t in transactions], dtype=np.int64, count=n)
+    types = np.frombuffer(bytes(t['type'] == TransactionType.CREDIT.value for t in transactions), dtype=np.uint8)
+    soa = TransactionArrays(amounts=amounts, timestamps=timestamps, types=types)
+
+    with _CACHE_LOCK:
+        _SOA_CACHE[id(transactions)] = (transactions, soa)
+        if len(_SOA_CACHE) > _SOA_CACHE_SIZE:
+            _SOA_CACHE.popitem(last=False)
+    return soa
+
+def cached_tool(func):
+    """Memoize a filter tool's result per transactions list and arguments."""
+    @functools.wraps(func)
+    def wrapper(transactions: List[dict], **kwargs):
+        key = (func.__name__, tuple(sorted(kwargs.items())), id(transactions))
+        with _CACHE_LOCK:
+            cached = _RESULT_CACHE.get(key)
+            if cached is not None and cached[0] is transactions:
+                return cached[1]
+        result = func(transactions, **kwargs)
+        with _CACHE_LOCK:
+            _RESULT_CACHE[key] = (transactions, result)
+        return result
+    return wrapper
+
+def _parse_date(value: Optional[str], field: str) -> Optional[int]:
+    if not value:
+        return None
+    try:
+        return date_to_timestamp(value)
+    except ValueError:
+        raise ValueError(f"{field} must be in YYYY-MM-DD format")
+
+def _kernel_bounds(start_ts, end_ts, transaction_type, min_amount, max_amount) -> tuple:
+    # Map optional filters onto the kernels' sentinel arguments
+    if start_ts is None:
+        start_ts, end_ts = NO_START_TS, NO_END_TS
+    elif end_ts is None:
+        end_ts = start_ts
+    if not transaction_type:
+        type_code = TYPE_ANY
+    else:
+        type_code = TYPE_CREDIT if transaction_type == TransactionType.CREDIT else TYPE_DEBIT
+    return (
+        NO_MIN_AMOUNT if min_amount is None else float(min_amount),
+        NO_MAX_AMOUNT if max_amount is None else float(max_amount),
+        start_ts,
+        end_ts,
+        type_code,
+    )
+
+def _sum(transactions: List[dict], start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+         transaction_type: Optional[TransactionType] = None,
+         min_amount: Optional[float] = None, max_amount: Optional[float] = None) -> float:
+    soa = _to_soa(transactions)
+    return float(sum_filtered(soa.amounts, soa.timestamps, soa.types,
+                              *_kernel_bounds(start_ts, end_ts, transaction_type, min_amount, max_amount)))
+
+def _count(transactions: List[dict], start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+           transaction_type: Optional[TransactionType] = None,
+           min_amount: Optional[float] = None, max_amount: Optional[float] = None) -> int:
+    soa = _to_soa(transactions)
+    return int(count_filtered(soa.amounts, soa.timestamps, soa.types,
+                              *_kernel_bounds(start_ts, end_ts, transaction_type, min_amount, max_amount)))
 
 @tool
-def filter_by_date_and_count(transactions: List[TransactionTrim], start_date: Optional[str] = None, end_date: Optional[str] = None) -> int:
+@cached_tool
+def query_transactions(transactions: InjectedTransactions, op: Literal["sum", "count"],
+                       start_date: Optional[str] = None, end_date: Optional[str] = None,
+                       transaction_type: Optional[TransactionType] = None,
+                       min_amount: Optional[float] = None, max_amount: Optional[float] = None) -> Union[float, int]:
     """
-    Filter transactions by date range and count them.
+    Filter transactions by any combination of date range, type and amount range, then sum their amounts or count them.
 
     Args:
-        transactions: List of TransactionTrim dictionaries.
+        transactions: List of transaction dictionaries, injected from graph state.
+        op: 'sum' to total the amounts of matching transactions, 'count' to count them.
         start_date: Optional start date in YYYY-MM-DD format.
         end_date: Optional end date in YYYY-MM-DD format. Defaults to start_date if not provided.
-
-    Returns:
-        int: Number of filtered transactions.
-    """
-    date_pattern = r"^\d{4}-\d{2}-\d{2}$"
-    if start_date and not re.match(date_pattern, start_date):
-        raise ValueError("start_date must be in YYYY-MM-DD format")
-    if end_date and not re.match(date_pattern, end_date):
-        raise ValueError("end_date must be in YYYY-MM-DD format")
-
-    filtered = transactions
-    if start_date:
-        start = datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
-        end = datetime.strptime(end_date, '%Y-%m-%d').replace(tzinfo=timezone.utc) if end_date else start
-        filtered = [
-            t for t in transactions
-            if start <= datetime.fromisoformat(t['transactionDate'].replace('Z', '+00:00')).astimezone(timezone.utc) <= end
-        ]
-    return len(filtered)
-
-@tool
-def filter_by_type_and_sum(transactions: List[TransactionTrim], transaction_type: Optional[TransactionType] = None) -> float:
-    """
-    Filter transactions by type and sum their amounts.
-
-    Args:
-        transactions: List of TransactionTrim dictionaries.
         transaction_type: Optional type of transaction to filter ('credit' or 'debit').
-
-    Returns:
-        float: Sum of amounts for filtered transactions or 0.0 if no transactions match.
-    """
-    filtered = transactions
-    if transaction_type:
-        filtered = [t for t in transactions if t['type'] == transaction_type.value]
-    return sum(float(t['amount']) for t in filtered) if filtered else 0.0
-
-@tool
-def filter_by_type_and_count(transactions: List[TransactionTrim], transaction_type: Optional[TransactionType] = None) -> int:
-    """
-    Filter transactions by type and count them.
-
-    Args:
-        transactions: List of TransactionTrim dictionaries.
-        transaction_type: Optional type of transaction to filter ('credit' or 'debit').
-
-    Returns:
-        int: Number of filtered transactions.
-    """
-    filtered = transactions
-    if transaction_type:
-        filtered = [t for t in transactions if t['type'] == transaction_type.value]
-    return len(filtered)
-
-@tool
-def filter_by_amount_and_sum(transactions: List[TransactionTrim], min_amount: Optional[float] = None, max_amount: Optional[float] = None) -> float:
-    """
-    Filter transactions by amount range and sum their amounts.
-
-    Args:
-        transactions: List of TransactionTrim dictionaries.
-        min_amount: Optional minimum transaction amount.
-        max_amount: Optional maximum transaction amount.
-
-    Returns:
-        float: Sum of amounts for filtered transactions.
-    """
-    if min_amount is not None and min_amount < 0:
-        raise ValueError("min_amount must be non-negative")
-    if max_amount is not None and max_amount < 0:
-        raise ValueError("max_amount must be non-negative")
-
-    filtered = transactions
-    if min_amount is not None:
-        filtered = [t for t in filtered if float(t['amount']) >= min_amount]
-    if max_amount is not None:
-        filtered = [t for t in filtered if float(t['amount']) <= max_amount]
-    return sum(float(t['amount']) for t in filtered)
-
-@tool
-def filter_by_amount_and_count(transactions: List[TransactionTrim], min_amount: Optional[float] = None, max_amount: Optional[float] = None) -> int:
-    """
-    Filter transactions by amount range and count them.
-
-    Args:
-        transactions: List of TransactionTrim dictionaries.
         min_amount: Optional minimum transaction amount.
         max_amount: Optional maximum transaction amount.
 
     Returns:
-        int: Number of filtered transactions.
+        float | int: Sum of amounts (op='sum') or number (op='count') of filtered transactions.
     """
+    start_ts = _parse_date(start_date, "start_date")
+    end_ts = _parse_date(end_date, "end_date")
     if min_amount is not None and min_amount < 0:
         raise ValueError("min_amount must be non-negative")
     if max_amount is not None and max_amount < 0:
         raise ValueError("max_amount must be non-negative")
 
-    filtered = transactions
-    if min_amount is not None:
-        filtered = [t for t in filtered if float(t['amount']) >= min_amount]
-    if max_amount is not None:
-        filtered = [t for t in filtered if float(t['amount']) <= max_amount]
-    return len(filtered)
\ No newline at end of file
+    filters = dict(start_ts=start_ts, end_ts=end_ts, transaction_type=transaction_type,
+                   min_amount=min_amount, max_amount=max_amount)
+    if op == "count":
+        return _count(transactions, **filters)
+    return _sum(transactions, **filters)
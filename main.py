@@ -1,8 +1,14 @@
 import logging
-from fastapi import FastAPI, HTTPException
-from typing_extensions import TypedDict, List, Optional
+import base64
+import asyncio
+import msgspec
+from fastapi import FastAPI, HTTPException, Request
+from typing_extensions import TypedDict, List, Optional, Annotated
 from datetime import date
-from agent import create_graph, InputStateSchema, TransactionTrim
+from agent import create_graph, text_to_speech, get_llm_with_tools, InputStateSchema
+from agent_models_utils import TransactionTrim, iso_to_timestamp, convert_to_float
+from agent_kernels_utils import warm_up as warm_up_kernels
+from langchain_core.messages import AIMessage
 from langchain_core.prompts import HumanMessagePromptTemplate
 import re
 
@@ -11,68 +17,133 @@ logging.basicConfig(level=logging.INFO)
 logging.getLogger("langgraph").setLevel(logging.WARNING)  # Suppress verbose langgraph logs
 logger = logging.getLogger(__name__)
 
+# Prompts answered without the LLM. Both patterns must match the whole prompt,
+# so "hi, how much did I spend?" or "balance in January" still reach the graph.
+_GREETING_RE = re.compile(r"^\s*(hi|hello|hey)\b[\s!.,]*(there)?[\s!.,]*$", re.IGNORECASE)
+_BALANCE_RE = re.compile(
+    r"^\s*((what('s| is)|show|tell me) )?(me )?(my )?(current |account )?balance( please)?[\s?!.]*$",
+    re.IGNORECASE
+)
+GREETING_REPLY = "Hello! I'm AI Query, your financial assistant. How can I help you with your transactions today?"
+
+# Human prompt template, parsed once at import
+_PROMPT_TEMPLATE = HumanMessagePromptTemplate.from_template(
+    """
+    *prompt*: {prompt}
+    *date*: {date}
+    *transactions*: {transactions}
+    **Tools**: Use `query_transactions` to process transactions. Example: "Total debit amount in January 2025" -> call with `op="sum"`, `start_date="2025-01-01"`, `end_date="2025-01-31"`, `transaction_type="debit"`.
+    """
+)
+
 # Initialize FastAPI app
 app = FastAPI()
 
-# Global graph variable, to be initialized during startup
+# Global graph variable, initialized by a background task started at startup
 graph = None
+graph_init_task: Optional[asyncio.Task] = None
 
 # Request and response models
-class InvokeRequest(TypedDict):
-    prompt: str
-    thread_id: str
+class InvokeRequest(msgspec.Struct):
+    prompt: Annotated[str, msgspec.Meta(min_length=1)]
+    thread_id: Annotated[str, msgspec.Meta(min_length=1)]
     transactions: List[TransactionTrim]
-    get_audio: Optional[bool]
+    get_audio: Optional[bool] = False
 
 class InvokeResponse(TypedDict):
     messages: str
     audio: Optional[str]
 
-# Manual validation for InvokeRequest
-def validate_invoke_request(request: InvokeRequest):
-    if not isinstance(request.get('prompt'), str) or not request['prompt']:
-        raise ValueError("prompt must be a non-empty string")
-    if not isinstance(request.get('thread_id'), str) or not request['thread_id']:
-        raise ValueError("thread_id must be a non-empty string")
-    if not isinstance(request.get('transactions'), list):
-        raise ValueError("transactions must be a list")
-    if request.get('get_audio') is not None and not isinstance(request['get_audio'], bool):
-        raise ValueError("get_audio must be a boolean")
-    # Validate transactions
-    for t in request.get('transactions', []):
-        if not isinstance(t.get('transactionId'), str):
-            raise ValueError("transactionId must be a string")
-        if not isinstance(t.get('amount'), (str, int, float)):
-            raise ValueError("amount must be a number or string")
-        if t.get('type') not in ['credit', 'debit']:
-            raise ValueError("type must be 'credit' or 'debit'")
-        if t.get('currency') != 'NGN':
-            raise ValueError("currency must be 'NGN'")
-        if not isinstance(t.get('balance'), (str, int, float)):
-            raise ValueError("balance must be a number or string")
-        if not isinstance(t.get('transactionDate'), str) or not re.match(r"^\d{4}-\d{2}-\d{2}T.*Z$", t['transactionDate']):
+# The endpoint reads the raw body, so FastAPI can't derive the request schema;
+# publish msgspec's schema for InvokeRequest in the OpenAPI document instead
+(_INVOKE_REQUEST_SCHEMA,), _INVOKE_REQUEST_COMPONENTS = msgspec.json.schema_components(
+    [InvokeRequest], ref_template="#/components/schemas/{name}"
+)
+_default_openapi = app.openapi
+
+def openapi():
+    if app.openapi_schema is None:
+        schema = _default_openapi()
+        schema.setdefault("components", {}).setdefault("schemas", {}).update(_INVOKE_REQUEST_COMPONENTS)
+    return app.openapi_schema
+
+app.openapi = openapi
+
+# Field validation happens in msgspec while decoding; this only adds what the tools need
+def prepare_transactions(transactions: List[dict]):
+    for t in transactions:
+        # Parse once here so tools can compare epoch seconds directly
+        try:
+            t['_ts'] = iso_to_timestamp(t['transactionDate'])
+        except ValueError:
             raise ValueError("transactionDate must be in ISO 8601 format")
+        # Amounts may arrive as "1,234.56"; convert once so nothing downstream re-parses them
+        try:
+            t['amount'] = convert_to_float(t['amount'])
+            t['balance'] = convert_to_float(t['balance'])
+        except ValueError:
+            raise ValueError("amount and balance must be numeric")
+    # Most recent first, in place; the prompt and tools share this one list
+    transactions.sort(key=lambda x: x['_ts'], reverse=True)
 
-# Startup event to initialize graph
-@app.on_event("startup")
-async def startup_event():
+# Prompt summary of the (most-recent-first) transactions; the rows themselves stay with the tools
+def summarize_transactions(transactions: List[dict]) -> str:
+    if not transactions:
+        return "0 transactions"
+    min_date = transactions[-1]['transactionDate'][:10]
+    max_date = transactions[0]['transactionDate'][:10]
+    current_balance = transactions[0]['balance']
+    return (
+        f"{len(transactions)} transactions from {min_date} to {max_date}, balances in NGN, "
+        f"current balance {current_balance:.2f} NGN"
+    )
+
+# Deterministic reply for trivially classifiable prompts, or None to use the graph
+def fast_path_reply(prompt: str, transactions: List[dict]) -> Optional[str]:
+    if _GREETING_RE.match(prompt):
+        return GREETING_REPLY
+    if transactions and _BALANCE_RE.match(prompt):
+        # Transactions are sorted most recent first by prepare_transactions
+        return f"Your current balance is {transactions[0]['balance']:.2f} NGN."
+    return None
+
+# Builds the graph and warms the model and kernels; the blocking parts run in
+# threads so health checks are answered while this is in progress
+async def initialize_graph():
     global graph
     try:
-        graph = await create_graph()
+        compiled_graph = await create_graph()
+        await asyncio.to_thread(get_llm_with_tools)
         logger.info("Successfully initialized graph")
+        await asyncio.to_thread(warm_up_kernels)
+        logger.info("Compiled transaction filter kernels")
+        # Only publish the graph once everything it depends on is ready
+        graph = compiled_graph
     except Exception as e:
         logger.error(f"Failed to initialize graph: {str(e)}", exc_info=True)
         raise
 
-# Shutdown event to clean up resources
-@app.on_event("shutdown")
-async def shutdown_event():
-    global graph
+# Audio for a fast-path reply; like the speaker node, a TTS failure only drops the audio
+async def fast_path_audio(reply: str) -> Optional[str]:
     try:
-        await graph.checkpointer.conn.close()
-        logger.info("Closed aiosqlite connection")
+        return base64.b64encode(await text_to_speech(reply)).decode("utf-8")
     except Exception as e:
-        logger.error(f"Failed to close aiosqlite connection: {str(e)}", exc_info=True)
+        logger.error(f"Failed to generate audio: {str(e)}", exc_info=True)
+        return None
+
+# Startup event to initialize graph without holding up the server
+@app.on_event("startup")
+async def startup_event():
+    global graph_init_task
+    graph_init_task = asyncio.create_task(initialize_graph())
+
+# Exception raised by the startup initialization, or None if it succeeded or is still running
+def graph_init_error() -> Optional[BaseException]:
+    if graph_init_task is None or not graph_init_task.done():
+        return None
+    if graph_init_task.cancelled():
+        return asyncio.CancelledError("Graph initialization was cancelled")
+    return graph_init_task.exception()
 
 # Index
 @app.get("/")
@@ -85,50 +156,65 @@ async def index():
 # Health check
 @app.get("/health")
 async def health_check():
+    error = graph_init_error()
+    if error is not None:
+        raise HTTPException(status_code=503, detail=f"Graph initialization failed: {str(error)}")
     return {"status": "healthy"}
 
 # Invoke graph endpoint
-@app.post("/conversation", response_model=InvokeResponse)
-async def invoke_graph(request: InvokeRequest):
+@app.post(
+    "/conversation",
+    response_model=InvokeResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _INVOKE_REQUEST_SCHEMA}}
+        }
+    }
+)
+async def invoke_graph(raw_request: Request):
     global graph
+    if graph_init_task is not None and not graph_init_task.done():
+        # Requests arriving during startup wait for initialization to finish
+        await asyncio.wait([graph_init_task])
+    error = graph_init_error()
+    if error is not None:
+        logger.error(f"Graph initialization failed: {str(error)}")
+        raise HTTPException(status_code=503, detail=f"Graph initialization failed: {str(error)}")
     if graph is None:
         logger.error("Graph is not initialized")
         raise HTTPException(status_code=500, detail="Graph is not initialized")
     try:
-        # Validate request
-        validate_invoke_request(request)
-
-        prompt = request['prompt']
-        thread_id = request['thread_id']
-        transactions = [t.copy() for t in request['transactions']]
-        transactions = sorted(transactions, key=lambda x: x['transactionDate'], reverse=True)
-        get_audio = request.get('get_audio', False)
-
-        prompt_template = HumanMessagePromptTemplate.from_template(
-            """
-            *prompt*: {prompt}
-            *date*: {date}
-            *transactions*: {transactions}
-            **Tools**: You have access to the following tools to process transactions:
-                - **filter_by_date_and_sum**: Sum transactions by date range. Example: "Total debit amount in January 2025" -> call with `start_date="2025-01-01"`, `end_date="2025-01-31"`, `transaction_type="debit"`.
-                - **filter_by_date_and_count**: Count transactions by date range. Example: "How many credit transactions in January 2025?" -> call with `start_date="2025-01-01"`, `end_date="2025-01-31"`, `transaction_type="credit"`.
-                - **filter_by_type_and_sum**: Sum transactions by type. Example: "Total credit amount" -> call with `transaction_type="credit"`.
-                - **filter_by_type_and_count**: Count transactions by type. Example: "How many debit transactions?" -> call with `transaction_type="debit"`.
-                - **filter_by_amount_and_sum**: Sum transactions by amount range. Example: "Total amount for transactions above 1000 NGN" -> call with `min_amount=1000`.
-                - **filter_by_amount_and_count**: Count transactions by amount range. Example: "Count transactions below 500 NGN" -> call with `max_amount=500`.
-            """
-        )
-        prompt_message = prompt_template.format(
+        # Decode and validate in one pass; msgspec.ValidationError is a ValueError
+        request = msgspec.json.decode(await raw_request.body(), type=InvokeRequest)
+
+        prompt = request.prompt
+        thread_id = request.thread_id
+        # Graph state is checkpointed, so keep plain dicts there rather than Structs
+        transactions = msgspec.to_builtins(request.transactions)
+        prepare_transactions(transactions)
+        get_audio = bool(request.get_audio)
+
+        prompt_message = _PROMPT_TEMPLATE.format(
             prompt=prompt, 
             date=date.today(), 
-            transactions=transactions
+            transactions=summarize_transactions(transactions)
         )
+        config = {"configurable": {"thread_id": thread_id}}
+
+        reply = fast_path_reply(prompt, transactions)
+        if reply is not None:
+            # Record the turn so follow-up questions on this thread see it
+            await graph.aupdate_state(config, {"messages": [prompt_message, AIMessage(content=reply)]}, as_node="assistant")
+            audio = await fast_path_audio(reply) if get_audio else None
+            logger.info(f"Answered prompt without the graph: {prompt}, thread_id: {thread_id}")
+            return {"messages": reply, "audio": audio}
+
         input_state: InputStateSchema = {
             "messages": [prompt_message],
-            "transactions": request['transactions'],
+            "transactions": transactions,
             "get_audio": get_audio
         }
-        config = {"configurable": {"thread_id": thread_id}}
         
         # Use asynchronous graph.invoke
         result = await graph.ainvoke(input_state, config=config)